@@ -0,0 +1,325 @@
+#!/usr/bin/env python3
+"""Canonical image -> SSD1306 framebuffer conversion pipeline.
+
+Everything performance-relevant lives here so there is exactly one copy
+of the aspect fit, dither, packer and writers; img_to_oled.py is just
+the CLI on top.
+"""
+
+import os
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+
+from PIL import Image, ImageOps, ImageSequence
+
+# NumPy and Numba are both optional accelerators: without NumPy the
+# packer falls back to a pure-Pillow img.tobytes() path, and Numba only
+# ever builds on top of NumPy.
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+try:
+    from numba import njit, prange
+except ImportError:
+    njit = prange = None
+
+
+WIDTH = 128
+HEIGHT = 64
+PAGES = HEIGHT // 8
+FRAMEBUFFER_SIZE = WIDTH * PAGES
+
+# One hex literal per byte value, so the writers do a table lookup
+# instead of running a format spec per byte.
+_HEX = [f"0x{i:02X}" for i in range(256)]
+_HEX_TBL = np.array(_HEX) if np is not None else None
+
+
+def _hex_lines(fb, indent, suffix):
+    # Format a framebuffer as 16-byte source lines.  The fancy-indexing
+    # gather turns the whole buffer into hex literals in one NumPy call;
+    # only the per-line join stays in Python.
+    data = bytes(fb)
+    if np is None:
+        return [indent + ", ".join(_HEX[b] for b in data[i:i+16]) + suffix + "\n"
+                for i in range(0, len(data), 16)]
+
+    rows = _HEX_TBL[np.frombuffer(data, np.uint8).reshape(-1, 16)]
+    return [indent + ", ".join(row) + suffix + "\n" for row in rows]
+
+
+def fit_to_aspect(img, target_aspect, bg_color=0):
+    w, h = img.size
+    img_aspect = w / h
+
+    # Already the right shape: skip the canvas allocation and full-image
+    # paste entirely.
+    if abs(img_aspect - target_aspect) < 1e-3:
+        return img
+
+    if img_aspect > target_aspect:
+        new_w = w
+        new_h = int(w / target_aspect)
+    else:
+        new_h = h
+        new_w = int(h * target_aspect)
+
+    # Keep the source mode so a single-channel input is not expanded to
+    # three channels just to be padded.
+    canvas = Image.new(img.mode, (new_w, new_h), bg_color)
+    canvas.paste(img, ((new_w - w) // 2, (new_h - h) // 2))
+    return canvas
+
+
+RESAMPLE_FILTERS = {
+    "bilinear": Image.BILINEAR,
+    "bicubic": Image.BICUBIC,
+    "lanczos": Image.LANCZOS,
+}
+
+
+def _fs_dither(a):
+    # Serpentine Floyd-Steinberg on a float32 luminance buffer, returning
+    # 0/1 per pixel.  Only used via Numba (see below): the plain-Python
+    # loop would lose to Pillow's C dither, the compiled one fuses
+    # threshold + error diffusion into a single cache-resident pass.
+    h, w = a.shape
+    out = np.zeros((h, w), np.uint8)
+
+    for y in range(h):
+        dx = 1 if y % 2 == 0 else -1
+        x = 0 if dx == 1 else w - 1
+
+        for _ in range(w):
+            old = a[y, x]
+            new = 255.0 if old >= 128.0 else 0.0
+            if new > 0.0:
+                out[y, x] = 1
+            err = old - new
+
+            if 0 <= x + dx < w:
+                a[y, x + dx] += err * (7.0 / 16.0)
+            if y + 1 < h:
+                if 0 <= x - dx < w:
+                    a[y + 1, x - dx] += err * (3.0 / 16.0)
+                a[y + 1, x] += err * (5.0 / 16.0)
+                if 0 <= x + dx < w:
+                    a[y + 1, x + dx] += err * (1.0 / 16.0)
+
+            x += dx
+
+    return out
+
+
+if njit is not None:
+    _fs_dither = njit(cache=True)(_fs_dither)
+
+
+def process_frame(img, invert, resample=Image.BILINEAR):
+    # The target is single-channel, so drop to luminance before padding
+    # and resizing - one channel through the resampler instead of three,
+    # and convert("1") then dithers the "L" buffer directly without an
+    # internal grayscale conversion.
+    img = img.convert("L")
+    img = fit_to_aspect(img, target_aspect=2.0)
+    img = img.resize((WIDTH, HEIGHT), resample)
+
+    # Invert before dithering (as the CLI help promises) - mode "1" is
+    # not universally supported by ImageOps.invert, and inverting the
+    # continuous-tone image gives the dither the real luminance to work
+    # with instead of flipping already-quantized pixels.
+    if invert:
+        img = ImageOps.invert(img)
+
+    # Return both the mode-"1" frame (for --image) and the 0/1 pixel
+    # array (for the packer) so the buffer path never has to re-extract
+    # pixels from the PIL image.  Without NumPy the array slot is None
+    # and the caller packs via image_to_framebuffer instead.
+    if njit is None:
+        img = img.convert("1", dither=Image.FLOYDSTEINBERG)
+        return img, np.asarray(img, dtype=np.uint8) if np is not None else None
+
+    bits = _fs_dither(np.asarray(img, dtype=np.float32))
+    img = Image.frombytes("1", img.size, np.packbits(bits, axis=1).tobytes())
+    return img, bits
+
+
+def _build_fallback_packer():
+    # WIDTH and PAGES are constants, so partial-evaluate the packer: emit
+    # one straight-line statement per output byte with every buffer
+    # offset, shift and mask already folded, and let exec compile it.
+    # No loop control, no branch per bit.
+    stride = WIDTH // 8
+    lines = ["def _pack(buf, fb):"]
+
+    for page in range(PAGES):
+        for x in range(WIDTH):
+            offset = page * 8 * stride + (x >> 3)
+            shift = 7 - (x & 7)
+            terms = " | ".join(
+                f"((buf[{offset + bit * stride}] >> {shift} & 1) << {bit})"
+                for bit in range(8))
+            lines.append(f"    fb[{page * WIDTH + x}] = {terms}")
+
+    ns = {}
+    exec("\n".join(lines), ns)
+    return ns["_pack"]
+
+
+_fallback_pack = None
+
+
+def image_to_framebuffer(img):
+    # Pure-Pillow fallback packer.  img.tobytes() hands over the packed
+    # mode-"1" bitmap (one row = WIDTH/8 bytes, MSB = leftmost pixel) in
+    # a single C-level copy - per-pixel PixelAccess indexing is what made
+    # the original loop slow - leaving only the row-to-page bit shuffle
+    # to the generated straight-line code.  Built lazily so the NumPy
+    # path never pays for the codegen.
+    global _fallback_pack
+    if _fallback_pack is None:
+        _fallback_pack = _build_fallback_packer()
+
+    # Preallocated: 1 byte per entry and no list growth or PyLong boxing.
+    fb = bytearray(FRAMEBUFFER_SIZE)
+    _fallback_pack(img.tobytes(), fb)
+    return bytes(fb)
+
+
+if njit is not None:
+    @njit(parallel=True, cache=True)
+    def _pack_frames_jit(arr, out):
+        for f in prange(arr.shape[0]):
+            for page in range(PAGES):
+                for x in range(WIDTH):
+                    byte = 0
+                    for bit in range(8):
+                        if arr[f, page * 8 + bit, x]:
+                            byte |= 1 << bit
+                    out[f, page * WIDTH + x] = byte
+
+
+def pack_frames(arr):
+    # arr is (N, HEIGHT, WIDTH) with nonzero = lit pixel; returns the
+    # packed (N, FRAMEBUFFER_SIZE) pages for all frames in one shot.
+    if njit is not None:
+        out = np.empty((arr.shape[0], FRAMEBUFFER_SIZE), np.uint8)
+        _pack_frames_jit(arr, out)
+        return out
+
+    packed = np.packbits(
+        arr.reshape(-1, PAGES, 8, WIDTH), axis=2, bitorder="little")
+    return packed.reshape(arr.shape[0], FRAMEBUFFER_SIZE)
+
+
+def get_frame_duration(frame, default=100):
+    return frame.info.get("duration", default)
+
+
+def _process_frame_worker(job):
+    # Runs in a worker process: rebuild the frame from raw bytes (live
+    # PIL frames don't ship across processes cheaply), resize + dither,
+    # and return the packed mode-"1" bytes.
+    raw, size, invert, resample = job
+    frame = Image.frombytes("L", size, raw)
+    processed, _ = process_frame(frame, invert, resample)
+    # Ship the packed 1-bit bytes back, not the 8x larger pixel array.
+    return processed.tobytes()
+
+
+def process_animation(img, invert, resample, keep_images, pack):
+    """Convert an animated image to (frames_img, durations, frames_fb).
+
+    The resize + dither pipeline is CPU-bound and independent per frame,
+    so it is sharded across cores; decoding and packing stay in the
+    parent.  frames_img is empty unless keep_images, frames_fb is None
+    unless pack.
+    """
+    durations = []
+    jobs = []
+    for frame in ImageSequence.Iterator(img):
+        durations.append(get_frame_duration(frame))
+        jobs.append(
+            (frame.convert("L").tobytes(), frame.size, invert, resample))
+    n_frames = len(jobs)
+
+    # One contiguous (N, H, W) tensor instead of lists of per-frame
+    # Python objects; pack_frames consumes it without restacking.
+    frames_arr = (
+        np.empty((n_frames, HEIGHT, WIDTH), np.uint8)
+        if np is not None else None)
+    frames_img = []
+    frames_fb = [] if pack else None
+
+    chunksize = max(1, n_frames // (4 * (os.cpu_count() or 1)))
+    with ProcessPoolExecutor() as ex:
+        results = ex.map(_process_frame_worker, jobs, chunksize=chunksize)
+        for i, raw in enumerate(results):
+            processed = Image.frombytes("1", (WIDTH, HEIGHT), raw)
+            if np is not None:
+                frames_arr[i] = np.asarray(processed)
+            elif pack:
+                frames_fb.append(image_to_framebuffer(processed))
+
+            if keep_images:
+                frames_img.append(processed)
+
+    if pack and np is not None:
+        frames_fb = pack_frames(frames_arr)
+
+    return frames_img, durations, frames_fb
+
+
+def write_c_static(fb, path):
+    lines = [
+        "#include <stdint.h>\n\n",
+        f"const uint8_t framebuffer[{FRAMEBUFFER_SIZE}] = {{\n",
+        *_hex_lines(fb, "    ", ","),
+        "};\n",
+    ]
+    Path(path).write_text("".join(lines))
+
+
+def write_c_animated(frames, durations, path):
+    # Accumulate the whole file and write it in one go rather than one
+    # f.write per 16-byte line (~64 writes per frame).
+    lines = [
+        "#include <stdint.h>\n\n",
+        f"#define N_FRAMES {len(frames)}\n\n",
+        "const uint16_t frame_durations[N_FRAMES] = {\n    ",
+        ", ".join(str(d) for d in durations),
+        "\n};\n\n",
+        "const uint8_t framebuffer[N_FRAMES][1024] = {\n",
+    ]
+    for fb in frames:
+        lines.append("    {\n")
+        lines.extend(_hex_lines(fb, "        ", ","))
+        lines.append("    },\n")
+    lines.append("};\n")
+
+    Path(path).write_text("".join(lines))
+
+
+def write_asm_static(fb, path):
+    Path(path).write_text("".join(_hex_lines(fb, "    .byte ", "")))
+
+
+def write_asm_animated(frames, durations, path):
+    lines = [
+        f"n_frames: .hword {len(frames)}\n\n",
+        "frame_durations:\n",
+        "    .hword " + ", ".join(str(d) for d in durations) + "\n",
+    ]
+    for idx, fb in enumerate(frames):
+        lines.append(f"\nframe_{idx}:\n")
+        lines.append("    .byte 0x40                       // Data control byte\n")
+        lines.extend(_hex_lines(fb, "    .byte ", ""))
+
+    Path(path).write_text("".join(lines))
+
+
+def write_durations_txt(durations, out_dir):
+    Path(out_dir, "durations.txt").write_text(
+        "".join(f"frame_{i:03d}: {d}\n" for i, d in enumerate(durations)))